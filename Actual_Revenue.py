@@ -1,143 +1,200 @@
 import os
 import re
+import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine
+
+from db import get_engine
+
+# Compiled once at import time
+REVENUE_CODE_RE = re.compile(r"^\d{4}\.\d{2}\.\d{2}$")
 
 # -------------------------------------------------------------
 # 1. SQL SERVER CONNECTION
 # -------------------------------------------------------------
-server = r'localhost\RUSH'
-database = 'DevServer'
-username = 'sa'
-password = 'Qwertyui123#'
-
-connection_string = (
-    f"mssql+pyodbc://{username}:{password}@{server}/{database}"
-    "?driver=ODBC+Driver+17+for+SQL+Server"
-)
-
-engine = create_engine(connection_string)
+engine = get_engine()
 print("✅ Connection established with SQL Server.")
 
 # -------------------------------------------------------------
-# 2. READ EXCEL WITH 4TH ROW AS HEADER
+# 2. PARQUET CACHE FOR RE-RUNS
 # -------------------------------------------------------------
 file_path = r'C:\Users\rushika\Downloads\Actual revenue ETL\2020 Actual Revenue.xlsx'
+cache_path = file_path + ".parquet"
 
-df = pd.read_excel(file_path, header=3, usecols="A:N")
-df.columns = df.columns.str.strip()
-
-# -------------------------------------------------------------
-# 3. IDENTIFY VALID REVENUE CODE ROWS (xxxx.xx.xx)
-# -------------------------------------------------------------
-pattern = re.compile(r"^\d{4}\.\d{2}\.\d{2}$")
-valid_rows = df[df.iloc[:, 0].astype(str).str.match(pattern, na=False)]
-
-# Slice only up to the last valid row
-last_index = valid_rows.index[-1]
-df = df.loc[:last_index].copy()
-
-# -------------------------------------------------------------
-# 4. CLEAN VALUES
-# -------------------------------------------------------------
-df = df.replace("-", pd.NA)
-df = df.map(lambda x: x.strip() if isinstance(x, str) else x)
-
-# If Revenue Source is blank → fill using Revenue Code
-df.iloc[:, 1] = df.iloc[:, 1].fillna(df.iloc[:, 0])
-
-# -------------------------------------------------------------
-# 5. SPLIT FIXED & MONTHLY COLUMNS
-# -------------------------------------------------------------
-fixed_cols = df.columns[:2]      # Revenue Code, Revenue Source
-month_cols = df.columns[2:]      # Jan–Dec columns
-
-# -------------------------------------------------------------
-# 6. MELT TO LONG FORMAT
-# -------------------------------------------------------------
-df_melted = df.melt(
-    id_vars=fixed_cols,
-    value_vars=month_cols,
-    var_name="Month",
-    value_name="Value"
+# Re-runs load the cleaned frame straight from Parquet, skipping the
+# Excel parse and reshape entirely
+use_cache = (
+    os.path.exists(cache_path)
+    and os.path.getmtime(cache_path) >= os.path.getmtime(file_path)
 )
 
-# -------------------------------------------------------------
-# 7. ADD YEAR AND DATE FROM FILE NAME
-# -------------------------------------------------------------
-file_name = os.path.basename(file_path)
-match = re.search(r"(\d{4})", file_name)
-
-if not match:
-    raise ValueError("❌ No 4-digit year found in the file name.")
-
-extracted_year = int(match.group(1))
-
-df_melted["Year"] = extracted_year
-df_melted["Date"] = df_melted["Year"].astype(str) + " " + df_melted["Month"].astype(str)
-
-# -------------------------------------------------------------
-# 8. FINAL RENAME
-# -------------------------------------------------------------
-df_final = df_melted.rename(columns={
-    df.columns[0]: "Revenue Code",
-    df.columns[1]: "Revenue Source"
-})[["Date", "Revenue Code", "Revenue Source", "Value"]]
-
-# -------------------------------------------------------------
-# 9. ENSURE ALL 12 MONTHS EXIST
-# -------------------------------------------------------------
-month_order = [
-    "January", "February", "March", "April", "May", "June",
-    "July", "August", "September", "October", "November", "December"
-]
-
-unique_codes = df_final["Revenue Code"].unique()
-
-reindex_template = pd.MultiIndex.from_product(
-    [unique_codes, month_order],
-    names=["Revenue Code", "Month"]
-)
-
-df_final["Month"] = df_final["Date"].str.split().str[1]
-
-df_final = (
-    df_final
-    .set_index(["Revenue Code", "Month"])
-    .reindex(reindex_template)
-    .reset_index()
-)
-
-df_final["Year"] = extracted_year
-
-df_final = df_final[["Year", "Month", "Revenue Code", "Revenue Source", "Value"]]
-
-df_final = df_final.rename(columns={
-    "Revenue Code": "Revenue_Code",
-    "Revenue Source": "Revenue_Source"
-})
-
-# Numeric conversion
-df_final["Value"] = pd.to_numeric(df_final["Value"], errors="coerce")
-
-# -------------------------------------------------------------
-# 10. PREVIEW
+if use_cache:
+    print(f"⚡ Loading cached Parquet: {cache_path}")
+    df_final = pd.read_parquet(cache_path)
+else:
+    # ---------------------------------------------------------
+    # 3. READ EXCEL WITH 4TH ROW AS HEADER
+    # ---------------------------------------------------------
+    # Peek at the header row first so the two id columns can be typed
+    # as strings up front instead of going through per-column inference;
+    # the month columns come back natively typed from calamine and may
+    # legitimately carry "-" placeholders, so they are left alone
+    header_cols = pd.read_excel(
+        file_path, header=3, usecols="A:N", nrows=0, engine="calamine"
+    ).columns
+    dtype_map = {header_cols[0]: "string", header_cols[1]: "string"}
+
+    # calamine streams the sheet instead of building openpyxl's full DOM
+    df = pd.read_excel(
+        file_path, header=3, usecols="A:N", engine="calamine", dtype=dtype_map
+    )
+    df.columns = df.columns.str.strip()
+
+    # ---------------------------------------------------------
+    # 4. FILTER ONLY VALID REVENUE CODE ROWS (xxxx.xx.xx)
+    # ---------------------------------------------------------
+    codes = df.iloc[:, 0].astype("string")
+
+    # Cheap fixed-length check first so blanks and totals rows never
+    # reach the regex engine
+    code_mask = codes.str.len().eq(10).fillna(False)
+    code_mask &= codes.where(code_mask).str.match(REVENUE_CODE_RE, na=False)
+
+    # Keep only the valid code rows; blanks and subtotals between codes
+    # would otherwise fan out into 12 melted rows each
+    df = df[code_mask].reset_index(drop=True)
+
+    # ---------------------------------------------------------
+    # 5. CLEAN VALUES
+    # ---------------------------------------------------------
+    # Only the two id columns can carry the "-" placeholder; the month
+    # columns get their non-numeric cells coerced to NaN by the final
+    # pd.to_numeric pass
+    df.iloc[:, :2] = df.iloc[:, :2].replace("-", pd.NA)
+
+    # Vectorized strip on the string columns only; fillna puts back any
+    # non-string cells that str.strip turned into NA
+    obj_cols = df.select_dtypes(include=["object", "string"]).columns
+    df[obj_cols] = df[obj_cols].apply(lambda s: s.str.strip().fillna(s))
+
+    # If Revenue Source is blank → fill using Revenue Code
+    df.iloc[:, 1] = df.iloc[:, 1].fillna(df.iloc[:, 0])
+
+    # ---------------------------------------------------------
+    # 6. SPLIT FIXED & MONTHLY COLUMNS
+    # ---------------------------------------------------------
+    fixed_cols = df.columns[:2]      # Revenue Code, Revenue Source
+    month_cols = df.columns[2:]      # Jan–Dec columns
+
+    # ---------------------------------------------------------
+    # 7. STACK TO LONG FORMAT
+    # ---------------------------------------------------------
+    # stack() reshapes in a single pass instead of melt's copy;
+    # future_stack keeps NA cells so no months are silently dropped
+    df_melted = (
+        df.set_index(list(fixed_cols))[month_cols]
+        .rename_axis(columns="Month")
+        .stack(future_stack=True)
+        .rename("Value")
+        .reset_index()
+    )
+
+    # ---------------------------------------------------------
+    # 8. ADD YEAR FROM FILE NAME
+    # ---------------------------------------------------------
+    file_name = os.path.basename(file_path)
+    match = re.search(r"(\d{4})", file_name)
+
+    if not match:
+        raise ValueError("❌ No 4-digit year found in the file name.")
+
+    extracted_year = int(match.group(1))
+
+    df_melted["Year"] = extracted_year
+
+    # ---------------------------------------------------------
+    # 9. FINAL RENAME
+    # ---------------------------------------------------------
+    df_final = df_melted.rename(columns={
+        df.columns[0]: "Revenue Code",
+        df.columns[1]: "Revenue Source"
+    })[["Year", "Month", "Revenue Code", "Revenue Source", "Value"]]
+
+    # ---------------------------------------------------------
+    # 10. ENSURE ALL 12 MONTHS EXIST
+    # ---------------------------------------------------------
+    month_order = [
+        "January", "February", "March", "April", "May", "June",
+        "July", "August", "September", "October", "November", "December"
+    ]
+
+    unique_codes = df_final["Revenue Code"].unique()
+
+    # One cartesian template + hash merge instead of
+    # set_index/reindex/reset_index, which sorts and copies every column
+    template = pd.DataFrame({
+        "Revenue Code": np.repeat(unique_codes, len(month_order)),
+        "Month": np.tile(month_order, len(unique_codes)),
+    })
+
+    df_final = template.merge(df_final, on=["Revenue Code", "Month"], how="left")
+
+    df_final["Year"] = extracted_year
+
+    df_final = df_final[["Year", "Month", "Revenue Code", "Revenue Source", "Value"]]
+
+    df_final = df_final.rename(columns={
+        "Revenue Code": "Revenue_Code",
+        "Revenue Source": "Revenue_Source"
+    })
+
+    # Numeric conversion
+    df_final["Value"] = pd.to_numeric(df_final["Value"], errors="coerce")
+
+    # Low-cardinality columns as Categorical: the pipeline works on
+    # small integer codes while the original strings still reach SQL
+    df_final["Month"] = pd.Categorical(
+        df_final["Month"], categories=month_order, ordered=True
+    )
+    df_final["Revenue_Code"] = df_final["Revenue_Code"].astype("category")
+
+    # Cache the normalized frame for the next run
+    df_final.to_parquet(cache_path, compression="zstd")
+
+# -------------------------------------------------------------
+# 11. PREVIEW
 # -------------------------------------------------------------
 print(df_final.head(20))
 print(f"\nTotal rows after ensuring 12 months per Revenue Code: {len(df_final)}")
 
 # -------------------------------------------------------------
-# 11. LOAD INTO SQL
+# 12. LOAD INTO SQL
 # -------------------------------------------------------------
 table_name = "Actual_Revenue"
 schema_name = "InsightStaging"
 
-df_final.to_sql(
-    table_name,
-    con=engine,
-    schema=schema_name,
-    if_exists='append',
-    index=False
+insert_sql = (
+    f"INSERT INTO {schema_name}.{table_name} "
+    "([Year], [Month], [Revenue_Code], [Revenue_Source], [Value]) "
+    "VALUES (?, ?, ?, ?, ?)"
 )
 
-print(f"✅ Successfully loaded {len(df_final)} rows into table '{schema_name}.{table_name}'.")
+if df_final.empty:
+    # pyodbc's executemany rejects an empty parameter sequence, and a
+    # summary-only workbook legitimately yields zero code rows
+    print("⚠️ No valid revenue rows found; nothing to load.")
+else:
+    # NaN/NA must become None so the driver sends NULL
+    rows = df_final.astype(object).where(df_final.notna(), None)
+
+    # Raw pyodbc executemany skips SQLAlchemy's per-row binding; itertuples
+    # feeds the cursor lazily so the rows are never buffered twice
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        cursor.fast_executemany = True
+        cursor.executemany(insert_sql, rows.itertuples(index=False, name=None))
+        raw.commit()
+    finally:
+        raw.close()
+
+    print(f"✅ Successfully loaded {len(df_final)} rows into table '{schema_name}.{table_name}'.")
@@ -2,24 +2,14 @@ import pandas as pd
 import os
 import calendar
 import re
-import pyodbc
-from sqlalchemy import create_engine
+
+from db import get_engine
 
 # --- 🗂 Folder containing all monthly Excel files ---
 folder_path = r'C:\Users\rushika\Downloads\Actual revenue ETL\Bank Collection'
 
-# SQL Server connection using working pyodbc driver
-server = r'localhost\RUSH'
-database = 'DevServer'
-username = 'sa'
-password = 'Qwertyui123#'
-
-# Create SQLAlchemy engine using the working pyodbc connection
-conn_str = (
-    f"mssql+pyodbc://{username}:{password}@{server}/{database}"
-    "?driver=ODBC+Driver+17+for+SQL+Server"
-)
-engine = create_engine(conn_str)
+# Shared SQLAlchemy engine (see db.py)
+engine = get_engine()
 
 # Table / schema
 table_name = 'Bank_Payment_Collection'
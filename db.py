@@ -0,0 +1,33 @@
+import os
+import functools
+from sqlalchemy import create_engine
+
+# -------------------------------------------------------------
+# SQL SERVER CONNECTION (shared by all ETL scripts)
+# -------------------------------------------------------------
+server = r'localhost\RUSH'
+database = 'DevServer'
+username = 'sa'
+password = 'Qwertyui123#'
+
+connection_string = (
+    f"mssql+pyodbc://{username}:{password}@{server}/{database}"
+    "?driver=ODBC+Driver+17+for+SQL+Server"
+)
+
+
+@functools.lru_cache(maxsize=1)
+def get_engine():
+    """Create the shared engine once per process and hand back the same one.
+
+    Pool sized for the parallel workers so concurrent writes can overlap
+    network latency instead of queueing on a single connection.
+    """
+    return create_engine(
+        connection_string,
+        fast_executemany=True,
+        pool_size=min(8, os.cpu_count()),
+        max_overflow=0,
+        pool_pre_ping=True,
+        pool_recycle=1800,
+    )